@@ -6,9 +6,11 @@ for extracurricular activities at Mergington High School.
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
-import os
+from fastapi.responses import RedirectResponse, Response
+import orjson
+import time
 from pathlib import Path
 from prisma import Prisma
 from prisma.models import Activity, Participant
@@ -16,185 +18,258 @@ from prisma.models import Activity, Participant
 app = FastAPI(title="Mergington High School API",
               description="API for viewing and signing up for extracurricular activities")
 
+# Compress larger responses such as the activities list
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
 # Mount the static files directory
 current_dir = Path(__file__).parent
-app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
-          "static")), name="static")
+app.mount("/static", StaticFiles(directory=current_dir / "static"), name="static")
 
-# Initialize Prisma client
+# Initialize Prisma client (one shared client, connected once at startup)
 prisma = Prisma()
 
+# SQLite tuning applied at startup. schema.prisma sets connection_limit=1,
+# so the engine keeps a single connection and per-connection PRAGMAs stick.
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-20000",  # 20 MB
+]
+
+# Short-lived cache of the serialized GET /activities body, cleared on
+# every signup/removal
+ACTIVITIES_CACHE_TTL = 10  # seconds
+# How old a cached body may be and still be served when the database fails
+ACTIVITIES_STALE_MAX_AGE = 3 * ACTIVITIES_CACHE_TTL  # seconds
+activities_cache = {"body": None, "fetched_at": 0.0, "expires_at": 0.0, "generation": 0}
+
+def invalidate_activities_cache():
+    # Keep the last result around as a fallback if the database fails.
+    # Bumping the generation stops an in-flight GET from re-caching rows
+    # it read before this write.
+    activities_cache["expires_at"] = 0.0
+    activities_cache["generation"] += 1
+
 @app.on_event("startup")
 async def startup():
     await prisma.connect()
+    for pragma in SQLITE_PRAGMAS:
+        # PRAGMAs return a row, so they have to go through query_raw
+        await prisma.query_raw(pragma)
+
+    # WAL can be silently refused (e.g. on some network filesystems)
+    journal_mode = (await prisma.query_raw("PRAGMA journal_mode"))[0]["journal_mode"]
+    if journal_mode.lower() != "wal":
+        print(f"Warning: SQLite journal_mode is {journal_mode}, expected wal")
+
+    await init_db()
 
 @app.on_event("shutdown")
 async def shutdown():
     await prisma.disconnect()
 
+# Sample data used to seed the database
+activities_data = {
+    "Chess Club": {
+        "description": "Learn strategies and compete in chess tournaments",
+        "schedule": "Fridays, 3:30 PM - 5:00 PM",
+        "maxParticipants": 12,
+        "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
+    },
+    "Programming Class": {
+        "description": "Learn programming fundamentals and build software projects",
+        "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
+        "maxParticipants": 20,
+        "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
+    },
+    "Gym Class": {
+        "description": "Physical education and sports activities",
+        "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
+        "maxParticipants": 30,
+        "participants": ["john@mergington.edu", "olivia@mergington.edu"]
+    },
+    "Soccer Team": {
+        "description": "Join the school soccer team and compete in local leagues",
+        "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
+        "maxParticipants": 18,
+        "participants": ["lucas@mergington.edu", "mia@mergington.edu"]
+    },
+    "Basketball Club": {
+        "description": "Practice basketball skills and play friendly matches",
+        "schedule": "Wednesdays, 3:30 PM - 5:00 PM",
+        "maxParticipants": 15,
+        "participants": ["liam@mergington.edu", "ava@mergington.edu"]
+    },
+    "Art Club": {
+        "description": "Explore painting, drawing, and other visual arts",
+        "schedule": "Mondays, 3:30 PM - 5:00 PM",
+        "maxParticipants": 16,
+        "participants": ["noah@mergington.edu", "isabella@mergington.edu"]
+    },
+    "Drama Society": {
+        "description": "Participate in acting, stage production, and school plays",
+        "schedule": "Fridays, 4:00 PM - 5:30 PM",
+        "maxParticipants": 20,
+        "participants": ["charlotte@mergington.edu", "jackson@mergington.edu"]
+    },
+    "Math Club": {
+        "description": "Solve challenging math problems and prepare for competitions",
+        "schedule": "Thursdays, 3:30 PM - 4:30 PM",
+        "maxParticipants": 14,
+        "participants": ["amelia@mergington.edu", "benjamin@mergington.edu"]
+    },
+    "Science Olympiad": {
+        "description": "Engage in science experiments and academic competitions",
+        "schedule": "Wednesdays, 4:00 PM - 5:00 PM",
+        "maxParticipants": 12,
+        "participants": ["elijah@mergington.edu", "harper@mergington.edu"]
+    }
+}
+
 # Initialize database with sample data
 async def init_db():
-    activities_data = {
-        "Chess Club": {
-            "description": "Learn strategies and compete in chess tournaments",
-            "schedule": "Fridays, 3:30 PM - 5:00 PM",
-            "maxParticipants": 12,
-            "participants": ["michael@mergington.edu", "daniel@mergington.edu"]
-        },
-        "Programming Class": {
-            "description": "Learn programming fundamentals and build software projects",
-            "schedule": "Tuesdays and Thursdays, 3:30 PM - 4:30 PM",
-            "maxParticipants": 20,
-            "participants": ["emma@mergington.edu", "sophia@mergington.edu"]
-        },
-        "Gym Class": {
-            "description": "Physical education and sports activities",
-            "schedule": "Mondays, Wednesdays, Fridays, 2:00 PM - 3:00 PM",
-            "maxParticipants": 30,
-            "participants": ["john@mergington.edu", "olivia@mergington.edu"]
-        },
-        "Soccer Team": {
-            "description": "Join the school soccer team and compete in local leagues",
-            "schedule": "Tuesdays and Thursdays, 4:00 PM - 5:30 PM",
-            "maxParticipants": 18,
-            "participants": ["lucas@mergington.edu", "mia@mergington.edu"]
-        },
-        "Basketball Club": {
-            "description": "Practice basketball skills and play friendly matches",
-            "schedule": "Wednesdays, 3:30 PM - 5:00 PM",
-            "maxParticipants": 15,
-            "participants": ["liam@mergington.edu", "ava@mergington.edu"]
-        },
-        "Art Club": {
-            "description": "Explore painting, drawing, and other visual arts",
-            "schedule": "Mondays, 3:30 PM - 5:00 PM",
-            "maxParticipants": 16,
-            "participants": ["noah@mergington.edu", "isabella@mergington.edu"]
-        },
-        "Drama Society": {
-            "description": "Participate in acting, stage production, and school plays",
-            "schedule": "Fridays, 4:00 PM - 5:30 PM",
-            "maxParticipants": 20,
-            "participants": ["charlotte@mergington.edu", "jackson@mergington.edu"]
-        },
-        "Math Club": {
-            "description": "Solve challenging math problems and prepare for competitions",
-            "schedule": "Thursdays, 3:30 PM - 4:30 PM",
-            "maxParticipants": 14,
-            "participants": ["amelia@mergington.edu", "benjamin@mergington.edu"]
-        },
-        "Science Olympiad": {
-            "description": "Engage in science experiments and academic competitions",
-            "schedule": "Wednesdays, 4:00 PM - 5:00 PM",
-            "maxParticipants": 12,
-            "participants": ["elijah@mergington.edu", "harper@mergington.edu"]
-        }
-    }
-    
-    for name, details in activities_data.items():
-        # Create or update activity
-        activity = await prisma.activity.upsert(
-            where={'name': name},
-            data={
-                'create': {
-                    'name': name,
-                    'description': details["description"],
-                    'schedule': details["schedule"],
-                    'maxParticipants': details["maxParticipants"]
-                },
-                'update': {
-                    'description': details["description"],
-                    'schedule': details["schedule"],
-                    'maxParticipants': details["maxParticipants"]
-                }
-            }
-        )
-        
-        # Add participants
-        for email in details["participants"]:
-            await prisma.participant.upsert(
-                where={
-                    'activityName_email': {
-                        'activityName': name,
-                        'email': email
-                    }
-                },
+    # Skip seeding if a previous start already did it
+    if await prisma.activity.count() >= len(activities_data):
+        return
+
+    # Queue every upsert and send them as one transaction
+    async with prisma.batch_() as batcher:
+        for name, details in activities_data.items():
+            # Create or update activity
+            batcher.activity.upsert(
+                where={'name': name},
                 data={
                     'create': {
-                        'email': email,
-                        'activityName': name
+                        'name': name,
+                        'description': details["description"],
+                        'schedule': details["schedule"],
+                        'max_participants': details["maxParticipants"]
                     },
-                    'update': {}
+                    'update': {
+                        'description': details["description"],
+                        'schedule': details["schedule"],
+                        'max_participants': details["maxParticipants"]
+                    }
                 }
             )
 
+            # Add participants
+            for email in details["participants"]:
+                batcher.participant.upsert(
+                    where={
+                        'activity_name_email': {
+                            'activity_name': name,
+                            'email': email
+                        }
+                    },
+                    data={
+                        'create': {
+                            'email': email,
+                            'activity_name': name
+                        },
+                        'update': {}
+                    }
+                )
+
 @app.get("/")
 def root():
     return RedirectResponse(url="/static/index.html")
 
 @app.get("/activities")
 async def get_activities():
+    if (activities_cache["body"] is not None
+            and time.monotonic() < activities_cache["expires_at"]):
+        return Response(activities_cache["body"], media_type="application/json")
+
+    generation = activities_cache["generation"]
     try:
-        # Get all activities with their participants
-        activities = await prisma.activity.find_many(
-            include={
-                'participants': True
-            }
+        # Get all activities with their participants in a single query
+        rows = await prisma.query_raw(
+            """
+            SELECT a.name, a.description, a.schedule, a.max_participants, p.email
+            FROM activities a
+            LEFT JOIN participants p ON p.activity_name = a.name
+            ORDER BY a.name
+            """
         )
-        
-        # Format response
+
+        # Format response, grouping the joined rows by activity
         result = {}
-        for activity in activities:
-            result[activity.name] = {
-                "description": activity.description,
-                "schedule": activity.schedule,
-                "max_participants": activity.max_participants,
-                "participants": [p.email for p in activity.participants]
-            }
-        return result
+        current_name = None
+        for row in rows:
+            if row["name"] != current_name:
+                current_name = row["name"]
+                result[current_name] = {
+                    "description": row["description"],
+                    "schedule": row["schedule"],
+                    "max_participants": row["max_participants"],
+                    "participants": []
+                }
+            if row["email"] is not None:
+                result[current_name]["participants"].append(row["email"])
+
+        # Serialize once and return the bytes directly, skipping FastAPI's
+        # jsonable_encoder pass
+        body = orjson.dumps(result)
+        if activities_cache["generation"] == generation:
+            now = time.monotonic()
+            activities_cache["body"] = body
+            activities_cache["fetched_at"] = now
+            activities_cache["expires_at"] = now + ACTIVITIES_CACHE_TTL
+        return Response(body, media_type="application/json")
     except Exception as e:
         print(f"Error in get_activities: {str(e)}")
+        # Serve the last good response rather than failing outright, as
+        # long as it is not too old
+        if (activities_cache["body"] is not None
+                and time.monotonic() - activities_cache["fetched_at"] < ACTIVITIES_STALE_MAX_AGE):
+            return Response(activities_cache["body"], media_type="application/json")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/activities/{activity_name}/signup")
 async def signup_for_activity(activity_name: str, email: str):
     """Sign up a student for an activity"""
     try:
-        # Get activity with participant count
-        activity = await prisma.activity.find_unique(
-            where={'name': activity_name},
-            include={
-                'participants': True
-            }
+        # Add participant only if the activity exists and has room, all in
+        # one atomic statement; the (activity_name, email) primary key makes
+        # OR IGNORE skip duplicate signups
+        inserted = await prisma.execute_raw(
+            """
+            INSERT OR IGNORE INTO participants (activity_name, email)
+            SELECT a.name, ?
+            FROM activities a
+            WHERE a.name = ?
+              AND (SELECT COUNT(*) FROM participants WHERE activity_name = a.name) < a.max_participants
+            """,
+            email,
+            activity_name
         )
-        
-        if not activity:
-            raise HTTPException(status_code=404, detail="Activity not found")
-        
-        # Check if activity is full
-        if len(activity.participants) >= activity.max_participants:
+
+        if not inserted:
+            # Nothing was inserted, find out why
+            activity = await prisma.activity.find_unique(where={'name': activity_name})
+            if not activity:
+                raise HTTPException(status_code=404, detail="Activity not found")
+
+            existing_participant = await prisma.participant.find_unique(
+                where={
+                    'activity_name_email': {
+                        'activity_name': activity_name,
+                        'email': email
+                    }
+                }
+            )
+            if existing_participant:
+                raise HTTPException(status_code=400, detail="Already signed up for this activity")
+
             raise HTTPException(status_code=400, detail="Activity is full")
-        
-        # Check if already signed up
-        existing_participant = await prisma.participant.find_first(
-            where={
-                'activity_name': activity_name,
-                'email': email
-            }
-        )
-        
-        if existing_participant:
-            raise HTTPException(status_code=400, detail="Already signed up for this activity")
-        
-        # Add participant
-        await prisma.participant.create(
-            data={
-                'email': email,
-                'activity_name': activity_name
-            }
-        )
-        
+
+        invalidate_activities_cache()
         return {"message": f"Successfully signed up for {activity_name}"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in signup_for_activity: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -202,27 +277,19 @@ async def signup_for_activity(activity_name: str, email: str):
 @app.delete("/activities/{activity_name}/participants/{email}")
 async def remove_participant(activity_name: str, email: str):
     """Remove a participant from an activity"""
-    # Check if participant exists
-    participant = await prisma.participant.find_unique(
+    # Remove participant; delete returns None when there was no such row
+    participant = await prisma.participant.delete(
         where={
-            'activityName_email': {
-                'activityName': activity_name,
+            'activity_name_email': {
+                'activity_name': activity_name,
                 'email': email
             }
         }
     )
-    
+
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found in activity")
-    
-    # Remove participant
-    await prisma.participant.delete(
-        where={
-            'activityName_email': {
-                'activityName': activity_name,
-                'email': email
-            }
-        }
-    )
+
+    invalidate_activities_cache()
     
     return {"message": f"Successfully removed from {activity_name}"}